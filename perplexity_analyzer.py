@@ -9,22 +9,34 @@ This script reads a portfolio summary from the exports/ directory and sends it t
 Perplexity's API for analysis and summarization, with enhanced debugging and verification.
 
 Requirements:
-- pip install openai requests python-dotenv
+- pip install openai httpx[http2] numpy python-dotenv
 
 Usage:
 1. Set your PERPLEXITY_API_KEY environment variable
 2. Ensure your portfolio summary is in exports/portfolio_summary.txt
 3. Run: python perplexity_analyzer.py
+   (or python perplexity_analyzer.py --batch-dir DIR to analyze many summaries at once)
+   Add --deep to use sonar-deep-research, or --model NAME to pick a model explicitly
 """
 
 import os
-import requests
 import json
+import argparse
+import atexit
+import contextlib
+import functools
+import hashlib
+import importlib
+import importlib.util
 import logging
+import pathlib
+import random
+import re
+import sqlite3
 import sys
+import threading
+import time
 from datetime import datetime
-from openai import OpenAI
-from dotenv import load_dotenv
 
 # Set up logging for debugging
 logging.basicConfig(
@@ -33,137 +45,603 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Load environment variables
-load_dotenv()
+# Successful connection checks are remembered here so the probe runs at most
+# once per VERIFICATION_TTL_SECONDS for a given API key
+CACHE_DIR = os.path.expanduser("~/.cache/perplexity_analyzer")
+VERIFICATION_CACHE_FILE = os.path.join(CACHE_DIR, "verified.json")
+VERIFICATION_TTL_SECONDS = 24 * 60 * 60
+
+# Library versions reported by --diagnose, reused until the install changes
+ENV_CACHE_FILE = os.path.join(CACHE_DIR, "env.json")
+DIAGNOSED_PACKAGES = ("openai", "httpx")
+
+# Analyses are written here, through a 1 MiB buffer
+EXPORTS_DIR = pathlib.Path("exports")
+OUTPUT_BUFFER_SIZE = 1 << 20
+
+# Anything larger is not a portfolio summary; only ~PROMPT_TOKEN_BUDGET tokens would be sent anyway
+MAX_SUMMARY_BYTES = 10 * 1024 * 1024
+
+PERPLEXITY_BASE_URL = "https://api.perplexity.ai"
+OPENAI_BASE_URL = "https://api.openai.com/v1"
+
+# Connection pool shared by every OpenAI client in this process (see _http_client)
+POOL_SIZE = 32
+KEEPALIVE_SECS = 90
+MAX_RETRIES = 5
+
+# The SDK only retries while opening a request; a streamed analysis that
+# fails part-way is retried as a whole, backing off exponentially with jitter
+RETRY_ATTEMPTS = 5
+RETRY_INITIAL_DELAY = 1.0
+RETRY_MAX_DELAY = 30.0
+
+# Batch mode keeps at most this many requests in flight
+BATCH_CONCURRENCY = 10
+
+# Small summaries go to the fast model, larger ones to sonar-pro; the slow
+# and expensive deep research model is only used when asked for (--deep)
+FAST_MODEL = "sonar"
+STANDARD_MODEL = "sonar-pro"
+DEEP_MODEL = "sonar-deep-research"
+FAST_MODEL_TOKEN_LIMIT = 2000
+ANALYSIS_MAX_TOKENS = 2000
+ANALYSIS_TEMPERATURE = 0.1
+DEFAULT_PROMPT = "Summarize this content in 100 lines"
+SYSTEM_PROMPT = "You are a financial advisor AI assistant. Analyze the portfolio data and provide insights based on current market conditions and best practices."
+
+# Combined prompts hold at most this many portfolios; beyond ~16 the
+# per-portfolio answer quality drops noticeably
+BATCH_PROMPT_SIZE = 8
+MAX_BATCH_PROMPT_SIZE = 16
+# Answers split out of a combined reply are cached under the model name plus
+# this tag; they were asked for with a different prompt and shared token
+# budget, so single analyses must never be served them
+BATCH_CACHE_TAG = "+combined"
+
+_THINK_BLOCK_RE = re.compile(r"<think>.*?</think>", re.DOTALL)
+
+# Portfolio content is capped at this many tokens before it is sent
+PROMPT_TOKEN_BUDGET = 8000
+# Rough characters-per-token ratio, used for routing and when tiktoken is unavailable
+CHARS_PER_TOKEN = 4
+
+_RULE_LINE_RE = re.compile(r"^[ \t]*([=\-_*])\1{2,}[ \t]*$", re.MULTILINE)
+_PADDING_RE = re.compile(r"[ \t]{2,}")
+_TRAILING_SPACE_RE = re.compile(r"[ \t]+$", re.MULTILINE)
+_BLANK_LINES_RE = re.compile(r"\n{3,}")
+
+# Known failure signatures (lowercase substrings of the error message) and
+# the guidance logged for them; the first matching entry wins
+_DIAGNOSES = [
+    (("proxies",), (
+        "🔍 DIAGNOSIS: This is a version compatibility issue!",
+        "   - Your OpenAI library version is incompatible with current httpx version",
+        "   - Solution 1: Update OpenAI to version 1.55.3+",
+        "   - Solution 2: Pin httpx to version 0.27.2",
+        "   - Add this to your requirements.txt: httpx==0.27.2",
+    )),
+    (("401", "unauthorized"), (
+        "🔍 DIAGNOSIS: API Key Authentication Error",
+        "   - Check if your PERPLEXITY_API_KEY is correct",
+        "   - Verify the API key hasn't expired",
+        "   - Ensure you have sufficient credits",
+    )),
+    (("404", "not found"), (
+        "🔍 DIAGNOSIS: Model or Endpoint Error",
+        "   - The specified model might not be available",
+        "   - Check if the base_url is correct",
+    )),
+    (("timeout", "timed out"), (
+        "🔍 DIAGNOSIS: Network Timeout",
+        "   - Check your internet connection",
+        "   - Try again in a few moments",
+    )),
+]
+
+def _log_diagnosis(error):
+    """Log guidance for a recognized API error; returns False if nothing matched"""
+    err_lower = str(error).lower()
+    for tokens, lines in _DIAGNOSES:
+        if any(token in err_lower for token in tokens):
+            for line in lines:
+                logger.error(line)
+            return True
+    return False
+
+@functools.lru_cache(maxsize=1)
+def _token_encoding():
+    """Return a tiktoken encoding for counting tokens, or None if it cannot be loaded
+
+    Perplexity does not publish its tokenizer; GPT-4's is close enough for budgeting.
+    """
+    try:
+        import tiktoken
+        return tiktoken.encoding_for_model("gpt-4")
+    except Exception as e:
+        logger.debug("tiktoken unavailable, estimating tokens from length: %s", e)
+        return None
+
+def _count_tokens(text):
+    """Estimate tokens in text from its length
+
+    Routing only needs a rough figure, so this never loads tiktoken.
+    """
+    return len(text) // CHARS_PER_TOKEN
+
+def _choose_model(portfolio_content, custom_prompt=None, deep=False):
+    """Pick the cheapest model suited to the request"""
+    if deep:
+        model = DEEP_MODEL
+    else:
+        tokens = _count_tokens(_trim(portfolio_content)) + _count_tokens(custom_prompt or DEFAULT_PROMPT)
+        model = FAST_MODEL if tokens <= FAST_MODEL_TOKEN_LIMIT else STANDARD_MODEL
+    logger.info("🧭 Routing analysis to %s", model)
+    return model
+
+@functools.lru_cache(maxsize=32)
+def _trim(content, max_tokens=PROMPT_TOKEN_BUDGET):
+    """Shrink portfolio content before it is sent to the model
+
+    Strips trailing whitespace and alignment padding, shortens separator
+    rules, drops consecutive duplicate lines, collapses runs of blank lines
+    and finally caps the result at max_tokens.
+    """
+    text = _TRAILING_SPACE_RE.sub("", content)
+    text = _RULE_LINE_RE.sub("---", text)
+    text = _PADDING_RE.sub(" ", text)
+
+    lines = []
+    for line in text.split("\n"):
+        if line and lines and line == lines[-1]:
+            continue
+        lines.append(line)
+    text = _BLANK_LINES_RE.sub("\n\n", "\n".join(lines)).strip()
+
+    # Every token covers at least one UTF-8 byte, so text this short is within
+    # budget without loading (and possibly downloading) the tokenizer
+    if len(text.encode('utf-8')) <= max_tokens:
+        return text
+
+    encoding = _token_encoding()
+    if encoding is not None:
+        tokens = encoding.encode(text)
+        if len(tokens) > max_tokens:
+            logger.warning("⚠️  Portfolio content truncated from %d to %d tokens", len(tokens), max_tokens)
+            text = encoding.decode(tokens[:max_tokens])
+    elif len(text) > max_tokens * CHARS_PER_TOKEN:
+        logger.warning("⚠️  Portfolio content truncated to ~%d tokens", max_tokens)
+        text = text[:max_tokens * CHARS_PER_TOKEN]
+
+    return text
+
+def _parse_batch_response(text, count):
+    """Split a combined JSON answer back into one analysis per portfolio
+
+    Returns a list of count analyses, or None if the answer is not a JSON
+    object with a string entry for every portfolio index (1-based).
+    """
+    text = _THINK_BLOCK_RE.sub("", text or "")
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end <= start:
+        return None
+    try:
+        payload = json.loads(text[start:end + 1])
+    except ValueError:
+        return None
+    if not isinstance(payload, dict):
+        return None
+
+    analyses = [payload.get(str(index)) for index in range(1, count + 1)]
+    if not all(isinstance(analysis, str) and analysis.strip() for analysis in analyses):
+        return None
+    return analyses
+
+def _emit(text, flush=True):
+    """Write analysis text to stdout as UTF-8 bytes; logs go to stderr, so stdout can be piped"""
+    stream = getattr(sys.stdout, "buffer", None)
+    if stream is None:
+        # Replaced stdout (e.g. in an IDE) without a binary buffer
+        sys.stdout.write(text)
+        if flush:
+            sys.stdout.flush()
+        return
+    stream.write(text.encode('utf-8'))
+    if flush:
+        stream.flush()
+
+def _analysis_path():
+    """Return the default, timestamped path for a new analysis file"""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return EXPORTS_DIR / f"portfolio_analysis_{timestamp}.txt"
+
+def _stdout_is_terminal():
+    """Return True if stdout is an interactive terminal rather than a pipe, file or capture"""
+    isatty = getattr(sys.stdout, "isatty", None)
+    return bool(isatty and isatty())
+
+@functools.lru_cache(maxsize=None)
+def _ensure_dir(path):
+    """Create a directory once per process, so batch runs don't re-create it per file"""
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+def _package_mtime(name):
+    """Return the modification time of an installed package without importing it"""
+    try:
+        spec = importlib.util.find_spec(name)
+    except (ImportError, ValueError):
+        return None
+    if spec is None or not spec.origin:
+        return None
+    try:
+        return os.path.getmtime(spec.origin)
+    except OSError:
+        return None
+
+def _pool_options():
+    """Keyword arguments for the httpx clients behind every OpenAI client"""
+    import httpx
+    return {
+        "limits": httpx.Limits(
+            max_connections=POOL_SIZE,
+            max_keepalive_connections=POOL_SIZE,
+            keepalive_expiry=KEEPALIVE_SECS
+        ),
+        "http2": True,
+        "timeout": httpx.Timeout(300.0, connect=10.0),
+        "follow_redirects": True,
+    }
+
+@functools.lru_cache(maxsize=1)
+def _http_client():
+    """Create the connection pool shared by every OpenAI client in this process"""
+    import httpx
+    return httpx.Client(**_pool_options())
+
+def _with_retries(call, attempts=RETRY_ATTEMPTS):
+    """Return call(), retrying rate limits, server errors and dropped connections"""
+    import httpx
+    import openai
+    transient = (
+        openai.RateLimitError,
+        openai.APIConnectionError,
+        openai.InternalServerError,
+        httpx.TransportError,
+    )
+
+    for attempt in range(1, attempts + 1):
+        try:
+            return call()
+        except transient as e:
+            if attempt == attempts:
+                raise
+            delay = min(RETRY_MAX_DELAY, RETRY_INITIAL_DELAY * 2 ** (attempt - 1) + random.uniform(0, RETRY_INITIAL_DELAY))
+            logger.debug("🔁 Attempt %d/%d failed (%s: %s), retrying in %.1fs",
+                         attempt, attempts, type(e).__name__, e, delay)
+            time.sleep(delay)
+
+@functools.lru_cache(maxsize=8)
+def _make_client(api_key, base_url=PERPLEXITY_BASE_URL):
+    """Create an OpenAI client, shared by every analyzer using the same key and endpoint"""
+    # openai and httpx are imported on first use so --help and cache hits stay fast
+    from openai import OpenAI
+    client = OpenAI(
+        api_key=api_key,
+        base_url=base_url,
+        http_client=_http_client(),
+        max_retries=MAX_RETRIES
+    )
+    atexit.register(client.close)
+    return client
+
+# Identical requests within the TTL are answered from this database
+RESPONSE_CACHE_FILE = os.path.join(CACHE_DIR, "cache.db")
+RESPONSE_CACHE_TTL_SECONDS = 24 * 60 * 60
+
+# Near-identical portfolios reuse an analysis when their embeddings are this
+# close (cosine similarity). Embedding sends the portfolio to OpenAI, so the
+# tier is off unless --semantic-cache or SEMANTIC_CACHE_ENV=1 asks for it;
+# it also requires OPENAI_API_KEY for the embeddings call.
+SEMANTIC_CACHE_ENV = "PERPLEXITY_SEMANTIC_CACHE"
+EMBEDDING_MODEL = "text-embedding-3-small"
+SEMANTIC_SIMILARITY_THRESHOLD = 0.97
+
+class ResponseCache:
+    """SQLite-backed store of API responses, keyed on everything that shapes the answer"""
+
+    def __init__(self, path=RESPONSE_CACHE_FILE, ttl=RESPONSE_CACHE_TTL_SECONDS):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.ttl = ttl
+        # Batch mode consults the cache from worker threads, one at a time
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses "
+            "(key TEXT PRIMARY KEY, response TEXT, created_at INT)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings "
+            "(key TEXT PRIMARY KEY, context TEXT, embedding BLOB, response TEXT, created_at INT)"
+        )
+        self.conn.commit()
+
+    @staticmethod
+    def make_key(model, messages, temperature, max_tokens):
+        """Hash the model, prompts and sampling settings into a cache key"""
+        parts = [model] + [message["content"] for message in messages] + [repr(temperature), str(max_tokens)]
+        return hashlib.sha256("\x1f".join(parts).encode('utf-8')).hexdigest()
+
+    def lookup(self, key):
+        """Return the cached response for key, or None if missing or expired"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or time.time() - row[1] >= self.ttl:
+            return None
+        return row[0]
+
+    def update(self, key, response):
+        """Store a response under key, replacing any previous entry"""
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, created_at) VALUES (?, ?, ?)",
+                (key, response, int(time.time()))
+            )
+
+    def lookup_similar(self, context, embedding, threshold):
+        """Return the freshest-matching response whose embedding is within threshold, or None
+
+        Only entries with the same context (model, prompts and sampling settings)
+        are compared. Embeddings are stored normalized, so a dot product is the
+        cosine similarity.
+        """
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT embedding, response FROM embeddings WHERE context = ? AND created_at > ?",
+                (context, int(time.time() - self.ttl))
+            ).fetchall()
+        if not rows:
+            return None
+
+        import numpy as np
+        matrix = np.frombuffer(b"".join(row[0] for row in rows), dtype=np.float32).reshape(len(rows), -1)
+        scores = matrix @ embedding
+        best = int(np.argmax(scores))
+        if scores[best] < threshold:
+            return None
+        return rows[best][1]
+
+    def update_embedding(self, key, context, embedding, response):
+        """Store a normalized embedding and its response for semantic lookups"""
+        import numpy as np
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO embeddings (key, context, embedding, response, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, context, embedding.astype(np.float32).tobytes(), response, int(time.time()))
+            )
 
 class PerplexityAnalyzer:
-    def __init__(self):
-        """Initialize the Perplexity analyzer with API credentials and verification"""
+    def __init__(self, use_cache=True, similarity_threshold=SEMANTIC_SIMILARITY_THRESHOLD,
+                 semantic_cache=None):
+        """Initialize the Perplexity analyzer with API credentials
+
+        The API client is created and verified on first use (see the client
+        property), so runs answered from the cache never touch the network.
+        semantic_cache=None reads the opt-in from SEMANTIC_CACHE_ENV.
+        """
+        from dotenv import load_dotenv
+        load_dotenv()
+
         self.api_key = os.getenv('PERPLEXITY_API_KEY')
-        logger.info(f"🔐 Loaded API Key: {self.api_key[:5] if self.api_key else 'None'}***")
+        logger.debug("🔐 Loaded API Key: %s***", self.api_key[:5] if self.api_key else 'None')
 
         if not self.api_key:
             raise ValueError("PERPLEXITY_API_KEY environment variable not found!")
 
-        # Perform connection verification before proceeding
-        self.client = self._initialize_client_with_verification()
+        self.cache = None
+        if use_cache:
+            try:
+                self.cache = ResponseCache()
+            except (sqlite3.Error, OSError) as e:
+                logger.warning("⚠️  Response cache unavailable, continuing without it: %s", e)
+
+        # The semantic tier needs an embeddings endpoint, which Perplexity does not offer
+        self.similarity_threshold = similarity_threshold
+        if semantic_cache is None:
+            semantic_cache = os.getenv(SEMANTIC_CACHE_ENV) == '1'
+        self.embedding_api_key = None
+        if semantic_cache and self.cache is not None:
+            self.embedding_api_key = os.getenv('OPENAI_API_KEY')
+            if self.embedding_api_key:
+                logger.info("🧠 Semantic cache enabled: portfolio summaries are embedded with OpenAI %s", EMBEDDING_MODEL)
+            else:
+                logger.warning("⚠️  Semantic cache requested but OPENAI_API_KEY is not set; skipping it")
+        self._embeddings = {}
+
+        self._client = None
+
+    @property
+    def client(self):
+        """OpenAI client for Perplexity, initialized and verified on first access"""
+        if self._client is None:
+            self._client = self._initialize_client_with_verification()
+        return self._client
 
     def _initialize_client_with_verification(self):
         """Initialize OpenAI client with proper configuration and verification"""
         try:
             logger.info("🔧 Initializing OpenAI client for Perplexity API...")
             
-            # Initialize client with explicit configuration
-            client = OpenAI(
-                api_key=self.api_key,
-                base_url="https://api.perplexity.ai"
-            )
+            # Reuse the process-wide client so its connection pool stays warm
+            client = _make_client(self.api_key, PERPLEXITY_BASE_URL)
             
             logger.info("✅ OpenAI client initialized successfully")
-            
+
+            # Skip the probe if this key was verified recently
+            if self._has_fresh_verification():
+                logger.info("✅ Client connection verified within the last %dh, skipping probe",
+                            VERIFICATION_TTL_SECONDS // 3600)
+                return client
+
             # Verify the client configuration
             if self._verify_client_connection(client):
                 logger.info("✅ Client connection verified successfully")
+                self._record_verification()
                 return client
             else:
                 raise RuntimeError("Client connection verification failed")
                 
         except Exception as e:
-            logger.error(f"❌ Failed to initialize OpenAI client: {e}")
-            logger.error(f"Error type: {type(e).__name__}")
+            logger.error("❌ Failed to initialize OpenAI client: %s", e)
+            logger.error("Error type: %s", type(e).__name__)
             
             # Provide specific guidance for common errors
-            if "proxies" in str(e):
-                logger.error("🔍 DIAGNOSIS: This is a version compatibility issue!")
-                logger.error("   - Your OpenAI library version is incompatible with current httpx version")
-                logger.error("   - Solution 1: Update OpenAI to version 1.55.3+")
-                logger.error("   - Solution 2: Pin httpx to version 0.27.2")
-                logger.error("   - Add this to your requirements.txt: httpx==0.27.2")
+            _log_diagnosis(e)
             
             raise
 
     def _verify_client_connection(self, client):
         """Verify that the client can connect to Perplexity API"""
+        from openai import NotFoundError
         try:
             logger.info("🔍 Verifying client connection to Perplexity API...")
             
-            # Make a minimal test request to verify connectivity
+            # Listing models is the cheapest authenticated request
+            try:
+                client.models.list()
+                logger.info("✅ Connection test successful: /models reachable")
+                return True
+            except NotFoundError:
+                logger.info("ℹ️  /models not available, falling back to a minimal completion")
+
             test_response = client.chat.completions.create(
                 model="sonar-pro",
                 messages=[
-                    {
-                        "role": "system", 
-                        "content": "You are a helpful assistant."
-                    },
                     {
                         "role": "user", 
                         "content": "Test connection. Reply with just 'OK'."
                     }
                 ],
-                max_tokens=5,
+                max_tokens=1,
                 temperature=0.1,
                 stream=False
             )
             
             if test_response and test_response.choices:
-                logger.info(f"✅ Connection test successful: {test_response.choices[0].message.content}")
+                logger.info("✅ Connection test successful")
                 return True
             else:
                 logger.error("❌ Connection test failed: No response received")
                 return False
                 
         except Exception as e:
-            logger.error(f"❌ Connection verification failed: {e}")
+            logger.error("❌ Connection verification failed: %s", e)
             
             # Provide detailed error analysis
-            if "401" in str(e) or "Unauthorized" in str(e):
-                logger.error("🔍 DIAGNOSIS: API Key Authentication Error")
-                logger.error("   - Check if your PERPLEXITY_API_KEY is correct")
-                logger.error("   - Verify the API key hasn't expired")
-                logger.error("   - Ensure you have sufficient credits")
-            elif "404" in str(e) or "Not Found" in str(e):
-                logger.error("🔍 DIAGNOSIS: Model or Endpoint Error")
-                logger.error("   - The specified model might not be available")
-                logger.error("   - Check if the base_url is correct")
-            elif "timeout" in str(e).lower():
-                logger.error("🔍 DIAGNOSIS: Network Timeout")
-                logger.error("   - Check your internet connection")
-                logger.error("   - Try again in a few moments")
-            else:
-                logger.error(f"🔍 DIAGNOSIS: Unknown Error - {type(e).__name__}: {e}")
+            if not _log_diagnosis(e):
+                logger.error("🔍 DIAGNOSIS: Unknown Error - %s: %s", type(e).__name__, e)
                 
             return False
 
+    def _api_key_digest(self):
+        """Return a SHA256 digest of the API key, so the key itself is never written to disk"""
+        return hashlib.sha256(self.api_key.encode('utf-8')).hexdigest()
+
+    def _has_fresh_verification(self):
+        """Check whether the current API key was verified within the TTL"""
+        try:
+            with open(VERIFICATION_CACHE_FILE, 'r', encoding='utf-8') as file:
+                entry = json.load(file)
+        except (OSError, ValueError):
+            return False
+
+        # Anything other than the object _record_verification writes is stale
+        if not isinstance(entry, dict) or entry.get('api_key_sha256') != self._api_key_digest():
+            return False
+        timestamp = entry.get('timestamp', 0)
+        if not isinstance(timestamp, (int, float)):
+            return False
+        return time.time() - timestamp < VERIFICATION_TTL_SECONDS
+
+    def _record_verification(self):
+        """Remember a successful verification for the current API key"""
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            with open(VERIFICATION_CACHE_FILE, 'w', encoding='utf-8') as file:
+                json.dump({'api_key_sha256': self._api_key_digest(), 'timestamp': time.time()}, file)
+        except OSError as e:
+            logger.warning("⚠️  Could not write verification cache: %s", e)
+
+    def _library_versions(self):
+        """Return the installed openai and httpx versions
+
+        Importing both libraries is slow, so the versions are cached in
+        ENV_CACHE_FILE and only re-read when the Python version or a
+        package's install time changes.
+        """
+        fingerprint = {name: _package_mtime(name) for name in DIAGNOSED_PACKAGES}
+        fingerprint['python'] = sys.version
+
+        try:
+            with open(ENV_CACHE_FILE, 'r', encoding='utf-8') as file:
+                entry = json.load(file)
+            # Anything other than the object written below is stale and rewritten
+            if (isinstance(entry, dict) and entry.get('fingerprint') == fingerprint
+                    and isinstance(entry.get('versions'), dict)):
+                return entry['versions']
+        except (OSError, ValueError):
+            pass
+
+        versions = {}
+        for name in DIAGNOSED_PACKAGES:
+            try:
+                versions[name] = importlib.import_module(name).__version__
+            except Exception:
+                versions[name] = None
+
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            with open(ENV_CACHE_FILE, 'w', encoding='utf-8') as file:
+                json.dump({'fingerprint': fingerprint, 'versions': versions}, file)
+        except OSError as e:
+            logger.warning("⚠️  Could not write environment cache: %s", e)
+        return versions
+
     def diagnose_environment(self):
         """Perform comprehensive environment diagnostics"""
         logger.info("🩺 Performing environment diagnostics...")
         
         # Check Python version
         python_version = sys.version_info
-        logger.info(f"🐍 Python version: {python_version.major}.{python_version.minor}.{python_version.micro}")
+        logger.info("🐍 Python version: %d.%d.%d", python_version.major, python_version.minor, python_version.micro)
+
+        versions = self._library_versions()
         
         # Check OpenAI library version
         try:
-            import openai
-            logger.info(f"🤖 OpenAI library version: {openai.__version__}")
+            openai_version = versions['openai']
+            logger.info("🤖 OpenAI library version: %s", openai_version)
             
             # Check if version is compatible
-            version_parts = openai.__version__.split('.')
+            version_parts = openai_version.split('.')
             major, minor = int(version_parts[0]), int(version_parts[1])
             
             if major == 1 and minor < 55:
                 logger.warning("⚠️  OpenAI library version may be incompatible")
                 logger.warning("   Consider updating to version 1.55.3 or later")
         except Exception as e:
-            logger.error(f"❌ Could not determine OpenAI version: {e}")
+            logger.error("❌ Could not determine OpenAI version: %s", e)
         
         # Check httpx version if available
         try:
-            import httpx
-            logger.info(f"🌐 httpx version: {httpx.__version__}")
+            httpx_version = versions['httpx']
+            logger.info("🌐 httpx version: %s", httpx_version)
             
             # Check if httpx version is problematic
-            version_parts = httpx.__version__.split('.')
+            version_parts = httpx_version.split('.')
             major, minor = int(version_parts[0]), int(version_parts[1])
             
             if major == 0 and minor >= 28:
@@ -178,106 +656,561 @@ class PerplexityAnalyzer:
             value = os.getenv(var)
             if value:
                 masked_value = f"{value[:5]}***" if len(value) > 5 else "***"
-                logger.info(f"🔐 {var}: {masked_value}")
+                logger.info("🔐 %s: %s", var, masked_value)
             else:
-                logger.info(f"🔐 {var}: Not set")
+                logger.info("🔐 %s: Not set", var)
 
-    def read_portfolio_summary(self, file_path="exports/portfolio_summary.txt"):
+    def read_portfolio_summary(self, file_path=EXPORTS_DIR / "portfolio_summary.txt"):
         """Read the portfolio summary from the specified file"""
         try:
-            logger.info(f"📁 Reading portfolio summary from {file_path}")
-            with open(file_path, 'r', encoding='utf-8') as file:
-                content = file.read()
-            logger.info(f"✅ Successfully loaded portfolio summary")
-            logger.info(f"📄 Content length: {len(content)} characters")
+            logger.info("📁 Reading portfolio summary from %s", file_path)
+            path = pathlib.Path(file_path)
+            size = path.stat().st_size
+            if size > MAX_SUMMARY_BYTES:
+                logger.error("❌ Error: %s is %d bytes, larger than the %d byte limit", file_path, size, MAX_SUMMARY_BYTES)
+                return None
+
+            content = path.read_text(encoding='utf-8')
+            logger.info("✅ Successfully loaded portfolio summary (%d bytes)", size)
             return content
         except FileNotFoundError:
-            logger.error(f"❌ Error: Could not find {file_path}")
+            logger.error("❌ Error: Could not find %s", file_path)
             logger.error("Make sure your portfolio analyzer has generated the summary file.")
             return None
         except Exception as e:
-            logger.error(f"❌ Error reading file: {e}")
+            logger.error("❌ Error reading file: %s", e)
             return None
 
-    def analyze_with_perplexity(self, portfolio_content, custom_prompt=None):
-        """Send portfolio content to Perplexity API for analysis"""
+    def _build_messages(self, portfolio_content, custom_prompt=None, system_prompt=SYSTEM_PROMPT):
+        """Build the chat messages for a portfolio analysis request"""
         if custom_prompt is None:
-            prompt = "Summarize this content in 100 lines"
+            prompt = DEFAULT_PROMPT
         else:
             prompt = custom_prompt
 
-        try:
-            logger.info("🔄 Sending request to Perplexity API...")
-            logger.info(f"📝 Using model: sonar-deep-research")
-
-            full_prompt = f"""
+        full_prompt = f"""
 {prompt}
 
 Portfolio Summary to Analyze:
-{portfolio_content}
+{_trim(portfolio_content)}
 """
 
-            response = self.client.chat.completions.create(
-                model="sonar-deep-research",
-                messages=[
-                    {
-                        "role": "system", 
-                        "content": "You are a financial advisor AI assistant. Analyze the portfolio data and provide insights based on current market conditions and best practices."
-                    },
-                    {
-                        "role": "user", 
-                        "content": full_prompt
-                    }
-                ],
-                max_tokens=2000,
-                temperature=0.1,
-                stream=False
-            )
+        return [
+            {
+                "role": "system", 
+                "content": system_prompt
+            },
+            {
+                "role": "user", 
+                "content": full_prompt
+            }
+        ]
+
+    def _cache_key(self, model, messages):
+        """Return the response cache key for an analysis request"""
+        return ResponseCache.make_key(model, messages, ANALYSIS_TEMPERATURE, ANALYSIS_MAX_TOKENS)
 
-            if response and response.choices:
+    def _lookup_exact(self, key):
+        """Return a cached analysis for key, if caching is enabled and the entry is fresh"""
+        if self.cache is None:
+            return None
+        try:
+            return self.cache.lookup(key)
+        except sqlite3.Error as e:
+            logger.warning("⚠️  Response cache lookup failed: %s", e)
+            return None
+
+    def _semantic_context(self, model, system_prompt, custom_prompt):
+        """Hash everything except the portfolio content, so only comparable requests are matched"""
+        parts = [model, system_prompt, repr(custom_prompt), repr(ANALYSIS_TEMPERATURE), str(ANALYSIS_MAX_TOKENS)]
+        return hashlib.sha256("\x1f".join(parts).encode('utf-8')).hexdigest()
+
+    def _embed(self, text):
+        """Return a normalized embedding of text, or None if the semantic tier is unavailable
+
+        Results are memoized per text, so the lookup before an API call and the
+        store after it share one embeddings request.
+        """
+        if not self.embedding_api_key:
+            return None
+
+        digest = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        if digest in self._embeddings:
+            return self._embeddings[digest]
+
+        vector = None
+        try:
+            import numpy as np
+            client = _make_client(self.embedding_api_key, OPENAI_BASE_URL)
+            response = client.embeddings.create(model=EMBEDDING_MODEL, input=text)
+            vector = np.asarray(response.data[0].embedding, dtype=np.float32)
+            vector = vector / np.linalg.norm(vector)
+        except Exception as e:
+            logger.warning("⚠️  Embedding request failed, skipping semantic cache: %s", e)
+
+        self._embeddings[digest] = vector
+        return vector
+
+    def _lookup_similar(self, portfolio_content, context):
+        """Look for a cached analysis of a near-identical portfolio"""
+        embedding = self._embed(portfolio_content)
+        if embedding is None:
+            return None
+        try:
+            return self.cache.lookup_similar(context, embedding, self.similarity_threshold)
+        except sqlite3.Error as e:
+            logger.warning("⚠️  Semantic cache lookup failed: %s", e)
+            return None
+
+    def _store_cache(self, key, analysis, portfolio_content=None, context=None):
+        """Remember a successful analysis, if caching is enabled
+
+        When portfolio_content and its semantic context are given, the
+        embedding is stored as well so near-identical portfolios can reuse
+        the analysis.
+        """
+        if self.cache is None:
+            return
+        embedding = self._embed(portfolio_content) if portfolio_content is not None else None
+        try:
+            self.cache.update(key, analysis)
+            if embedding is not None and context is not None:
+                self.cache.update_embedding(key, context, embedding, analysis)
+        except sqlite3.Error as e:
+            logger.warning("⚠️  Could not write response cache: %s", e)
+
+    def lookup_cache(self, portfolio_content, custom_prompt=None, model=None, system_prompt=SYSTEM_PROMPT,
+                     batch=False):
+        """Return a cached analysis for this request without contacting Perplexity, or None
+
+        A model of None is resolved with _choose_model(), as in analyze().
+        With batch=True only answers from combined requests are looked up
+        (see analyze_batch()).
+        """
+        if self.cache is None:
+            return None
+
+        model = model or _choose_model(portfolio_content, custom_prompt)
+        if batch:
+            model += BATCH_CACHE_TAG
+
+        cache_key = self._cache_key(model, self._build_messages(portfolio_content, custom_prompt, system_prompt))
+        cached = self._lookup_exact(cache_key)
+        if cached:
+            return cached
+
+        cached = self._lookup_similar(
+            portfolio_content, self._semantic_context(model, system_prompt, custom_prompt)
+        )
+        if cached:
+            logger.info("⚡ Found analysis of a near-identical portfolio")
+            self._store_cache(cache_key, cached)
+        return cached
+
+    def analyze(self, portfolio_content, custom_prompt=None, model=None,
+                system_prompt=SYSTEM_PROMPT, check_cache=True, output=None):
+        """Analyze portfolio content with a Perplexity model, streaming the answer
+
+        This is the single entry point for interactive analyses; the cache is
+        consulted first unless check_cache=False (for callers that already
+        missed in lookup_cache()). Successful responses are always cached.
+        When model is None it is picked by _choose_model(). Streamed text is
+        also written to output (see open_output()) as it arrives.
+        """
+        model = model or _choose_model(portfolio_content, custom_prompt)
+        messages = self._build_messages(portfolio_content, custom_prompt, system_prompt)
+        cache_key = self._cache_key(model, messages)
+
+        if check_cache:
+            cached = self.lookup_cache(portfolio_content, custom_prompt, model, system_prompt)
+            if cached:
+                logger.info("⚡ Using cached analysis, skipping API call")
+                _emit(cached + "\n")
+                if output is not None:
+                    output.write(cached)
+                    output.flush()
+                return cached
+
+        # On failure output is rewound to here, so it never holds a partial answer
+        start = output.tell() if output is not None else None
+
+        try:
+            logger.info("🔄 Sending request to Perplexity API...")
+            logger.info("📝 Using model: %s", model)
+
+            # Retries happen in _with_retries, so the SDK must not retry as well
+            client = self.client.with_options(max_retries=0)
+            # A terminal sees the answer as it streams; piped stdout only gets the
+            # attempt that succeeded, so a retry cannot leave a partial answer in it
+            live = _stdout_is_terminal()
+            attempts = 0
+
+            def request():
+                nonlocal attempts
+                attempts += 1
+                if attempts > 1 and live:
+                    _emit("\n")
+                    logger.warning("🔁 Stream interrupted, restarting the analysis")
+                # A retried stream starts the output over rather than appending to a partial answer
+                if output is not None:
+                    output.seek(start)
+                    output.truncate()
+                response = client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    max_tokens=ANALYSIS_MAX_TOKENS,
+                    temperature=ANALYSIS_TEMPERATURE,
+                    stream=True,
+                    stream_options={"include_usage": True}
+                )
+                return self._consume_stream(response, output, echo=live)
+
+            analysis = _with_retries(request)
+            if analysis and not live:
+                _emit(analysis + "\n")
+            if analysis:
                 logger.info("✅ Successfully received response from Perplexity API")
-                return response.choices[0].message.content
+                self._store_cache(
+                    cache_key, analysis, portfolio_content,
+                    self._semantic_context(model, system_prompt, custom_prompt)
+                )
+                return analysis
             else:
                 logger.error("❌ Received empty response from API")
-                return None
 
         except Exception as e:
-            logger.error(f"❌ Error calling Perplexity API: {e}")
-            logger.error(f"Error type: {type(e).__name__}")
-            return None
+            logger.error("❌ Error calling Perplexity API: %s", e)
+            logger.error("Error type: %s", type(e).__name__)
+            _log_diagnosis(e)
+
+        if output is not None:
+            output.seek(start)
+            output.truncate()
+        return None
+
+    def analyze_with_perplexity(self, portfolio_content, custom_prompt=None, model=None, check_cache=True):
+        """Send portfolio content to Perplexity API for analysis"""
+        return self.analyze(portfolio_content, custom_prompt, model, check_cache=check_cache)
+
+    def analyze_batch(self, portfolios, batch_size=BATCH_PROMPT_SIZE, custom_prompt=None,
+                      model=None, system_prompt=SYSTEM_PROMPT):
+        """Analyze several portfolios with one request per batch_size portfolios
+
+        Sharing a request sends the system prompt once per batch instead of once
+        per portfolio. Portfolios already in the cache (as single or combined
+        answers) are not resent, and a batch whose answer cannot be parsed
+        falls back to one analyze() call per portfolio. Returns one analysis
+        (or None) per portfolio. Portfolios that are identical once trimmed are
+        sent once and share the analysis.
+        """
+        # Group portfolios by the content that is actually sent, so each distinct
+        # one appears in one prompt and owns its cache entry
+        groups = {}
+        for index, portfolio_content in enumerate(portfolios):
+            digest = hashlib.sha256(_trim(portfolio_content).encode('utf-8')).hexdigest()
+            groups.setdefault(digest, (portfolio_content, []))[1].append(index)
+
+        duplicates = len(portfolios) - len(groups)
+        if duplicates:
+            logger.info("♻️  Skipping %d duplicate portfolio(s), sending %d unique", duplicates, len(groups))
+
+        unique = [portfolio_content for portfolio_content, _ in groups.values()]
+        batch_size = max(1, min(batch_size, MAX_BATCH_PROMPT_SIZE))
+        model = model or _choose_model("\n\n".join(unique), custom_prompt)
+        results = [
+            self.lookup_cache(content, custom_prompt, model, system_prompt)
+            or self.lookup_cache(content, custom_prompt, model, system_prompt, batch=True)
+            for content in unique
+        ]
+        pending = [index for index, cached in enumerate(results) if not cached]
+
+        for offset in range(0, len(pending), batch_size):
+            indexes = pending[offset:offset + batch_size]
+            sections = "\n\n".join(
+                f"### Portfolio {number} ###\n{_trim(unique[index])}"
+                for number, index in enumerate(indexes, 1)
+            )
+            prompt = DEFAULT_PROMPT if custom_prompt is None else custom_prompt
+            user_message = (
+                f"{prompt}\n\nAnalyze each portfolio below separately.\n\n{sections}\n\n"
+                "Respond with a JSON object mapping portfolio index to analysis."
+            )
+
+            analyses = None
+            try:
+                logger.info("🔄 Sending %d portfolios in one request to Perplexity API...", len(indexes))
+                response = self.client.chat.completions.create(
+                    model=model,
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": user_message}
+                    ],
+                    max_tokens=ANALYSIS_MAX_TOKENS * len(indexes),
+                    temperature=ANALYSIS_TEMPERATURE,
+                    stream=False
+                )
+                if response and response.choices:
+                    analyses = _parse_batch_response(response.choices[0].message.content, len(indexes))
+            except Exception as e:
+                logger.error("❌ Error calling Perplexity API: %s", e)
+
+            if analyses is None:
+                logger.warning("⚠️  Combined answer unusable, analyzing these portfolios one by one")
+                analyses = [
+                    self.analyze(unique[index], custom_prompt, model, system_prompt, check_cache=False)
+                    for index in indexes
+                ]
+            else:
+                batch_model = model + BATCH_CACHE_TAG
+                context = self._semantic_context(batch_model, system_prompt, custom_prompt)
+                for index, analysis in zip(indexes, analyses):
+                    messages = self._build_messages(unique[index], custom_prompt, system_prompt)
+                    self._store_cache(self._cache_key(batch_model, messages), analysis, unique[index], context)
+
+            for index, analysis in zip(indexes, analyses):
+                results[index] = analysis
+
+        shared = [None] * len(portfolios)
+        for (_, indexes), analysis in zip(groups.values(), results):
+            for index in indexes:
+                shared[index] = analysis
+        return shared
+
+    async def analyze_many_async(self, paths, custom_prompt=None, model=None,
+                                 system_prompt=SYSTEM_PROMPT, max_concurrency=BATCH_CONCURRENCY):
+        """Analyze several portfolio summaries concurrently, returning one analysis (or None) per path
+
+        When model is None, each portfolio is routed with _choose_model().
+        Files with identical content are sent once and share the analysis.
+        """
+        import asyncio
+        import httpx
+        from openai import AsyncOpenAI
+
+        # Group paths by content so each distinct portfolio costs one request
+        groups = {}
+        for index, path in enumerate(paths):
+            portfolio_content = self.read_portfolio_summary(path)
+            if portfolio_content:
+                digest = hashlib.sha256(portfolio_content.encode('utf-8')).hexdigest()
+                groups.setdefault(digest, (portfolio_content, []))[1].append(index)
+
+        duplicates = sum(len(indexes) - 1 for _, indexes in groups.values())
+        if duplicates:
+            logger.info("♻️  Skipping %d duplicate portfolio(s), sending %d unique", duplicates, len(groups))
+
+        semaphore = asyncio.Semaphore(max_concurrency)
+        http_client = httpx.AsyncClient(**_pool_options())
+
+        async with AsyncOpenAI(
+            api_key=self.api_key,
+            base_url=PERPLEXITY_BASE_URL,
+            http_client=http_client,
+            max_retries=MAX_RETRIES
+        ) as client:
+
+            async def _one(path, portfolio_content):
+                path_model = model or _choose_model(portfolio_content, custom_prompt)
+                messages = self._build_messages(portfolio_content, custom_prompt, system_prompt)
+                cache_key = self._cache_key(path_model, messages)
+                cached = await asyncio.to_thread(
+                    self.lookup_cache, portfolio_content, custom_prompt, path_model, system_prompt
+                )
+                if cached:
+                    logger.info("⚡ Using cached analysis for %s", path)
+                    return cached
+
+                async with semaphore:
+                    try:
+                        response = await client.chat.completions.create(
+                            model=path_model,
+                            messages=messages,
+                            max_tokens=ANALYSIS_MAX_TOKENS,
+                            temperature=ANALYSIS_TEMPERATURE,
+                            stream=False
+                        )
+                    except Exception as e:
+                        logger.error("❌ Error analyzing %s: %s", path, e)
+                        return None
+
+                if response and response.choices:
+                    logger.info("✅ Received analysis for %s", path)
+                    analysis = response.choices[0].message.content
+                    self._store_cache(
+                        cache_key, analysis, portfolio_content,
+                        self._semantic_context(path_model, system_prompt, custom_prompt)
+                    )
+                    return analysis
+                logger.error("❌ Received empty response for %s", path)
+                return None
+
+            analyses = await asyncio.gather(*[
+                _one(paths[indexes[0]], portfolio_content)
+                for portfolio_content, indexes in groups.values()
+            ])
+
+        results = [None] * len(paths)
+        for (_, indexes), analysis in zip(groups.values(), analyses):
+            for index in indexes:
+                results[index] = analysis
+        return results
+
+    def _consume_stream(self, response, output=None, echo=True):
+        """Write streamed chunks to output (and stdout, if echo) as they arrive and return the full text"""
+        parts = []
+        usage = None
+
+        for chunk in response:
+            if chunk.choices:
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    # Flushing per line rather than per token keeps syscalls down while still streaming
+                    if echo:
+                        _emit(delta, flush="\n" in delta)
+                    if output is not None:
+                        output.write(delta)
+                        output.flush()
+            if chunk.usage:
+                usage = chunk.usage
+
+        if parts and echo:
+            _emit("\n")
+        if usage:
+            logger.info("📊 Token usage: %s prompt + %s completion", usage.prompt_tokens, usage.completion_tokens)
+        return "".join(parts)
+
+    @contextlib.contextmanager
+    def open_output(self, filename=None):
+        """Open an analysis file with its header written, for streaming the analysis into
+
+        The file is written as <filename>.partial and only renamed into place
+        if something was written after the header, so readers of exports/
+        never see an empty or interrupted analysis. If the block raises, the
+        .partial file is left behind with whatever had arrived.
+        """
+        filename = pathlib.Path(filename or _analysis_path())
+        partial = filename.with_name(filename.name + ".partial")
+
+        _ensure_dir(filename.parent)
+        with partial.open('w', encoding='utf-8', buffering=OUTPUT_BUFFER_SIZE) as file:
+            file.write(f"Portfolio Analysis Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+            file.write("="*80 + "\n\n")
+            file.flush()
+            header_end = file.tell()
+            yield file
+            has_body = file.tell() > header_end
+
+        if has_body:
+            partial.replace(filename)
+        else:
+            partial.unlink()
 
     def save_analysis(self, analysis_content, filename=None):
         """Save the analysis result to a file"""
-        if filename is None:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"exports/portfolio_analysis_{timestamp}.txt"
-
+        filename = str(filename or _analysis_path())
         try:
-            os.makedirs('exports', exist_ok=True)
-            
-            with open(filename, 'w', encoding='utf-8') as file:
-                file.write(f"Portfolio Analysis Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\\n")
-                file.write("="*80 + "\\n\\n")
+            with self.open_output(filename) as file:
                 file.write(analysis_content)
 
-            logger.info(f"💾 Analysis saved to: {filename}")
+            logger.info("💾 Analysis saved to: %s", filename)
             return filename
 
         except Exception as e:
-            logger.error(f"❌ Error saving analysis: {e}")
+            logger.error("❌ Error saving analysis: %s", e)
             return None
 
-def main():
+def parse_args(argv=None):
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description="Analyze a portfolio summary with Perplexity AI")
+    parser.add_argument(
+        "--batch-dir",
+        help="Analyze every .txt portfolio summary in this directory concurrently"
+    )
+    parser.add_argument(
+        "--combine",
+        action="store_true",
+        help="With --batch-dir, send several portfolios per request instead of one each"
+    )
+    parser.add_argument(
+        "--model",
+        help=f"Perplexity model to use (default: {FAST_MODEL} or {STANDARD_MODEL} depending on summary size)"
+    )
+    parser.add_argument(
+        "--deep",
+        action="store_true",
+        help=f"Use {DEEP_MODEL} for a slower, more thorough analysis"
+    )
+    parser.add_argument(
+        "--diagnose",
+        action="store_true",
+        help="Log Python, library and environment diagnostics before analyzing"
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always call the API instead of reusing a cached analysis"
+    )
+    parser.add_argument(
+        "--semantic-cache",
+        action="store_true",
+        default=None,
+        help=f"Also reuse analyses of near-identical portfolios (same as {SEMANTIC_CACHE_ENV}=1); "
+             "sends each summary to OpenAI for embedding and needs OPENAI_API_KEY"
+    )
+    return parser.parse_args(argv)
+
+def run_batch(analyzer, batch_dir, combine=False, model=None):
+    """Analyze every portfolio summary in batch_dir and save one analysis per file"""
+    paths = sorted(
+        os.path.join(batch_dir, name)
+        for name in os.listdir(batch_dir)
+        if name.endswith(".txt")
+    )
+    if not paths:
+        logger.error("❌ No portfolio summaries found in %s", batch_dir)
+        return
+
+    logger.info("🤖 Starting batch analysis of %d portfolios...", len(paths))
+    if combine:
+        contents = [analyzer.read_portfolio_summary(path) for path in paths]
+        readable = [index for index, content in enumerate(contents) if content]
+        combined = analyzer.analyze_batch([contents[index] for index in readable], custom_prompt="", model=model)
+        analyses = [None] * len(paths)
+        for index, analysis in zip(readable, combined):
+            analyses[index] = analysis
+    else:
+        import asyncio
+        analyses = asyncio.run(analyzer.analyze_many_async(paths, "", model=model))
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    saved = 0
+    for path, analysis in zip(paths, analyses):
+        if not analysis:
+            continue
+        stem = os.path.splitext(os.path.basename(path))[0]
+        if analyzer.save_analysis(analysis, EXPORTS_DIR / f"portfolio_analysis_{timestamp}_{stem}.txt"):
+            saved += 1
+
+    logger.info("✅ Batch complete: %d/%d analyses saved", saved, len(paths))
+
+def main(argv=None):
     """Main function to orchestrate the portfolio analysis"""
-    logger.info("🚀 Enhanced Perplexity Portfolio Analyzer")
-    logger.info("=" * 50)
+    args = parse_args(argv)
+
+    logger.debug("🚀 Enhanced Perplexity Portfolio Analyzer")
+    logger.debug("=" * 50)
 
     try:
-        # Initialize analyzer with verification
-        analyzer = PerplexityAnalyzer()
+        # The API client is only initialized and verified on a cache miss
+        analyzer = PerplexityAnalyzer(use_cache=not args.no_cache, semantic_cache=args.semantic_cache)
         
-        # Perform environment diagnostics
-        analyzer.diagnose_environment()
+        if args.diagnose:
+            analyzer.diagnose_environment()
+
+        if args.batch_dir:
+            run_batch(analyzer, args.batch_dir, combine=args.combine, model=args.model or (DEEP_MODEL if args.deep else None))
+            return
 
         # Read portfolio summary
         portfolio_summary = analyzer.read_portfolio_summary()
@@ -285,18 +1218,24 @@ def main():
             logger.error("❌ Cannot proceed without portfolio summary")
             return
 
-        # Perform analysis
-        logger.info("🤖 Starting portfolio analysis...")
-        analysis = analyzer.analyze_with_perplexity(portfolio_summary, "")
+        model = args.model or _choose_model(portfolio_summary, "", deep=args.deep)
 
+        # Answer from the cache when possible, before touching the API
+        analysis = analyzer.lookup_cache(portfolio_summary, "", model)
         if analysis:
-            logger.info("\\n" + "="*80)
-            logger.info("🎯 PERPLEXITY AI ANALYSIS RESULT")
-            logger.info("="*80)
-            logger.info("="*80)
-
-            # Save analysis
+            logger.info("⚡ Using cached analysis, skipping API call")
+            _emit(analysis + "\n")
             saved_file = analyzer.save_analysis(analysis)
+        else:
+            logger.info("🤖 Starting portfolio analysis...")
+            # The analysis is written to disk as it streams, so a crash keeps what arrived
+            saved_file = str(_analysis_path())
+            with analyzer.open_output(saved_file) as output:
+                analysis = analyzer.analyze(portfolio_summary, "", model, check_cache=False, output=output)
+            if analysis:
+                logger.info("💾 Analysis saved to: %s", saved_file)
+
+        if analysis:
             if saved_file:
                 logger.info("✅ Analysis complete and saved successfully!")
             else:
@@ -305,13 +1244,13 @@ def main():
             logger.error("❌ Failed to get analysis from Perplexity API")
 
     except KeyboardInterrupt:
-        logger.info("\\n\\n👋 Analysis interrupted by user.")
+        logger.info("👋 Analysis interrupted by user.")
     except Exception as e:
-        logger.error(f"\\n❌ Analysis failed: {e}")
-        logger.error(f"Error type: {type(e).__name__}")
+        logger.error("❌ Analysis failed: %s", e)
+        logger.error("Error type: %s", type(e).__name__)
         
         # Print troubleshooting guide
-        logger.info("\\n🔧 TROUBLESHOOTING GUIDE:")
+        logger.info("🔧 TROUBLESHOOTING GUIDE:")
         logger.info("1. Update your requirements.txt with compatible versions:")
         logger.info("   openai>=1.55.3")
         logger.info("   httpx==0.27.2")
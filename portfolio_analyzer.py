@@ -19,43 +19,145 @@ Requirements:
 
 import pandas as pd
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from pathlib import Path
 import yfinance as yf
+import functools
+import hashlib
+import io
+import json
+import sys
+import time
 import warnings
 import os
 warnings.filterwarnings('ignore')
 
-def parse_mixed_datetime(time_str):
-    """Parse datetime strings with mixed formats (with and without milliseconds)"""
-    if pd.isna(time_str):
-        return pd.NaT
+# Trading 212 statement actions that move cash or shares
+CASH_ACTIONS = ['Deposit', 'Withdrawal', 'Interest on cash']
+BUY_ACTIONS = ['Market buy', 'Limit buy']
+SELL_ACTIONS = ['Market sell', 'Limit sell']
+
+# Actions are converted to a fixed categorical after loading, so the checks
+# below compare small integer codes; other actions (dividends, ...) become missing
+ACTION_DTYPE = pd.CategoricalDtype(CASH_ACTIONS + BUY_ACTIONS + SELL_ACTIONS)
+CASH_CODES, BUY_CODES, SELL_CODES = (
+    [ACTION_DTYPE.categories.get_loc(a) for a in actions]
+    for actions in (CASH_ACTIONS, BUY_ACTIONS, SELL_ACTIONS)
+)
+
+# Where the summary is written; perplexity_analyzer.py reads it from the same
+# working-directory-relative path
+SUMMARY_FILE = Path('exports') / 'portfolio_summary.txt'
+
+# Column types for the statement, so read_csv converts them while parsing
+CSV_DTYPES = {
+    'Action': 'category',
+    'Ticker': 'string',
+    'Quantity': 'float64',
+    'Total': 'float64',
+    'Currency conversion fee': 'float64',
+}
+
+# The only statement columns the analysis reads; the rest (ISIN, Name, Notes,
+# ID, ...) are never loaded
+CSV_COLUMNS = {'Time', 'Currency (Price / share)', *CSV_DTYPES}
+
+# Trading 212 tickers that need an exchange suffix on Yahoo Finance
+TICKER_MAPPINGS = {
+    'VUSA': 'VUSA.L',  # UK-listed ETF needs .L suffix
+    'AAPL': 'AAPL',
+    'AMZN': 'AMZN',
+    'AMD': 'AMD',
+    'MSFT': 'MSFT',
+    'NVDA': 'NVDA'
+}
+
+# One ticker summary line; keys are the position DataFrame's columns
+ROW = ("{Ticker:<8} {Shares:>8.3f} {Avg_EUR:>8.2f} {Cost_EUR:>10.2f} {Price_EUR:>9.2f} "
+       "{Value_EUR:>11.2f} {PnL_EUR:>10.2f} {PnL_pct:>7.2f}%")
+
+# Yahoo Finance pairs quoting EUR in each supported currency
+FX_PAIRS = {'USD': 'EURUSD=X', 'GBP': 'EURGBP=X'}
+
+# Per-ticker lookups (currencies, fallback prices) run this many at a time,
+# alongside the batched downloads
+PRICE_FETCH_WORKERS = 16
+
+# Yahoo Finance answers are reused across runs for these many seconds
+YF_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'yf')
+PRICE_CACHE_TTL = 60 * 60
+FX_CACHE_TTL = 24 * 60 * 60
+CURRENCY_CACHE_TTL = 90 * 24 * 60 * 60
+
+def _cache_path(kind, key):
+    """Path of the cache file for one yfinance lookup"""
+    digest = hashlib.md5(f"{kind}_{key}".encode('utf-8')).hexdigest()
+    return os.path.join(YF_CACHE_DIR, f"{digest}.json")
+
+def cache_get(kind, key, ttl):
+    """Return a cached yfinance value younger than ttl seconds, or None"""
+    path = _cache_path(kind, key)
+    try:
+        if time.time() - os.path.getmtime(path) < ttl:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+    except (OSError, ValueError):
+        pass
+    return None
+
+def cache_put(kind, key, value):
+    """Store a yfinance value; a read-only checkout just goes without the cache"""
+    try:
+        os.makedirs(YF_CACHE_DIR, exist_ok=True)
+        with open(_cache_path(kind, key), 'w', encoding='utf-8') as f:
+            json.dump(value, f)
+    except OSError:
+        pass
+
+@functools.lru_cache(maxsize=256)
+def _ticker(yf_ticker):
+    """Return a yfinance Ticker, built once per symbol and run"""
+    return yf.Ticker(yf_ticker)
+
+def _last_price(stock, default=0):
+    """Read the last price from fast_info, scraping info only if fast_info lacks it"""
+    try:
+        return stock.fast_info.last_price
+    except AttributeError:
+        info = stock.info
+        return info.get('regularMarketPrice', info.get('currentPrice', default))
 
+def _trading_currency(stock, default='USD'):
+    """Read the trading currency from fast_info, scraping info only if fast_info lacks it"""
     try:
-        # Try parsing with milliseconds first
-        if '.' in str(time_str):
-            return pd.to_datetime(time_str, format='%Y-%m-%d %H:%M:%S.%f')
-        else:
-            return pd.to_datetime(time_str, format='%Y-%m-%d %H:%M:%S')
-    except:
-        # Fallback to automatic parsing
-        return pd.to_datetime(time_str, errors='coerce')
+        return stock.fast_info.currency
+    except AttributeError:
+        return stock.info.get('currency', default)
 
+@functools.lru_cache(maxsize=None)
 def get_fx_rate(from_currency, to_currency='EUR'):
     """Get current FX rate from yfinance"""
     if from_currency == to_currency:
         return 1.0
 
+    cached = cache_get('fx', f"{from_currency}{to_currency}", FX_CACHE_TTL)
+    if cached is not None:
+        return cached
+
     try:
         if from_currency == 'USD':
-            ticker = 'EURUSD=X'
-            rate = yf.Ticker(ticker).info.get('regularMarketPrice', 1.08)
-            return 1/rate  # Convert USD to EUR
+            ticker = FX_PAIRS['USD']
+            rate = _last_price(_ticker(ticker), 1.08)
+            fx_rate = 1/rate  # Convert USD to EUR
         elif from_currency == 'GBP':
-            ticker = 'EURGBP=X'
-            rate = yf.Ticker(ticker).info.get('regularMarketPrice', 0.85)
-            return 1/rate  # Convert GBP to EUR
+            ticker = FX_PAIRS['GBP']
+            rate = _last_price(_ticker(ticker), 0.85)
+            fx_rate = 1/rate  # Convert GBP to EUR
         else:
             return 1.0
+        cache_put('fx', f"{from_currency}{to_currency}", fx_rate)
+        return fx_rate
     except:
         # Fallback rates
         fallback_rates = {'USD': 0.92, 'GBP': 1.17}
@@ -63,47 +165,136 @@ def get_fx_rate(from_currency, to_currency='EUR'):
 
 def get_correct_ticker_and_price(ticker):
     """Get the correct ticker symbol and current price"""
-    ticker_mappings = {
-        'VUSA': 'VUSA.L',  # UK-listed ETF needs .L suffix
-        'AAPL': 'AAPL',
-        'AMZN': 'AMZN',
-        'AMD': 'AMD',
-        'MSFT': 'MSFT',
-        'NVDA': 'NVDA'
-    }
-
-    yf_ticker = ticker_mappings.get(ticker, ticker)
+    yf_ticker = TICKER_MAPPINGS.get(ticker, ticker)
 
     try:
-        stock = yf.Ticker(yf_ticker)
+        stock = _ticker(yf_ticker)
 
         # Try to get recent data
         hist = stock.history(period='5d')
         if not hist.empty:
             price = hist['Close'].iloc[-1]
-            info = stock.info
-            currency = info.get('currency', 'USD')
+            currency = _trading_currency(stock)
             return price, currency
         else:
-            # Try info as fallback
-            info = stock.info
-            price = info.get('regularMarketPrice', info.get('currentPrice', 0))
-            currency = info.get('currency', 'USD')
+            # Try the quote as fallback
+            price = _last_price(stock)
+            currency = _trading_currency(stock)
             return price, currency
 
     except Exception as e:
         print(f"    ⚠️  Error fetching {ticker} ({yf_ticker}): {e}")
         return 0, 'EUR'
 
+def get_currency(yf_ticker):
+    """Get the trading currency of a Yahoo Finance symbol, or None if unavailable"""
+    currency = cache_get('currency', yf_ticker, CURRENCY_CACHE_TTL)
+    if currency is not None:
+        return currency
+
+    try:
+        currency = _ticker(yf_ticker).fast_info.currency
+    except Exception:
+        return None
+    cache_put('currency', yf_ticker, currency)
+    return currency
+
+def download_closes(yf_tickers):
+    """Download the last five days for several symbols at once and return each one's last close"""
+    try:
+        data = yf.download(list(yf_tickers), period='5d', group_by='ticker',
+                           threads=True, progress=False)
+    except Exception as e:
+        print(f"    ⚠️  Batched download failed: {e}")
+        return {}
+
+    closes = {}
+    for yf_ticker in set(data.columns.get_level_values(0)) & set(yf_tickers):
+        history = data[yf_ticker]['Close'].dropna()
+        if not history.empty:
+            closes[yf_ticker] = float(history.iloc[-1])
+    return closes
+
+def _fx_pairs(currencies):
+    """Return the Yahoo Finance FX pair of every currency whose EUR rate isn't cached"""
+    return {
+        currency: FX_PAIRS[currency] for currency in currencies
+        if currency in FX_PAIRS and cache_get('fx', f"{currency}EUR", FX_CACHE_TTL) is None
+    }
+
+def get_fx_rates(currencies, closes=None):
+    """Get the EUR conversion rate of every currency, downloading the FX pairs in one request
+
+    closes, if given, already holds the downloaded pairs (see get_prices()).
+    """
+    pairs = _fx_pairs(currencies)
+
+    rates = {}
+    if pairs:
+        if closes is None:
+            closes = download_closes(pairs.values())
+        for currency, pair in pairs.items():
+            if closes.get(pair):
+                rates[currency] = 1 / closes[pair]
+                cache_put('fx', f"{currency}EUR", rates[currency])
+
+    # Cached pairs, and pairs missing from the download, take the single-pair path
+    for currency in currencies:
+        if currency not in rates:
+            rates[currency] = get_fx_rate(currency, 'EUR')
+    return rates
+
+def get_prices(tickers, currencies=()):
+    """Get the current price and currency of every ticker with one batched download
+
+    The FX pairs of currencies are fetched in the same download (yf.download
+    keeps its results in module globals, so two downloads must never run at
+    once), and (prices, fx_rates) is returned. Prices fetched within
+    PRICE_CACHE_TTL are reused; tickers missing from the download fall back
+    to get_correct_ticker_and_price().
+    """
+    prices = {}
+    for ticker in tickers:
+        cached = cache_get('price', ticker, PRICE_CACHE_TTL)
+        if cached is not None:
+            prices[ticker] = tuple(cached)
+
+    yf_tickers = {ticker: TICKER_MAPPINGS.get(ticker, ticker) for ticker in tickers if ticker not in prices}
+    pairs = _fx_pairs(currencies)
+    if not yf_tickers and not pairs:
+        return prices, get_fx_rates(currencies)
+
+    # Only the fast_info and history lookups overlap the download
+    with ThreadPoolExecutor(max_workers=PRICE_FETCH_WORKERS) as pool:
+        download = pool.submit(download_closes, [*yf_tickers.values(), *pairs.values()])
+        ticker_currencies = dict(zip(yf_tickers, pool.map(get_currency, yf_tickers.values())))
+        closes = download.result()
+
+        fallbacks = [ticker for ticker, yf_ticker in yf_tickers.items()
+                     if yf_ticker not in closes or ticker_currencies[ticker] is None]
+        prices.update(zip(fallbacks, pool.map(get_correct_ticker_and_price, fallbacks)))
+
+    for ticker, yf_ticker in yf_tickers.items():
+        if ticker not in prices:
+            prices[ticker] = (closes[yf_ticker], ticker_currencies[ticker])
+
+        # A zero price means the lookup failed; don't keep it
+        if prices[ticker][0]:
+            cache_put('price', ticker, [float(prices[ticker][0]), prices[ticker][1]])
+    return prices, get_fx_rates(currencies, closes)
+
 def analyze_portfolio():
     """Main portfolio analysis function"""
     csv_file = os.path.join(os.path.dirname(__file__), "combined_statement.csv")
 
     print("🔄 Loading and processing Trading 212 statement...")
 
-    # Load CSV with robust parsing
+    # Load CSV with robust parsing; times (with and without milliseconds) and
+    # amounts are converted by the CSV parser itself
     try:
-        df = pd.read_csv(csv_file, quotechar='"', on_bad_lines='skip')
+        df = pd.read_csv(csv_file, quotechar='"', on_bad_lines='skip',
+                         usecols=lambda c: c in CSV_COLUMNS, parse_dates=['Time'],
+                         date_format='ISO8601', dtype=CSV_DTYPES)
     except FileNotFoundError:
         print(f"❌ Error: Could not find {csv_file}")
         print("Please ensure your CSV file is named 'combined_statement.csv' and is in the same directory.")
@@ -112,196 +303,127 @@ def analyze_portfolio():
         print(f"❌ Error loading CSV file: {e}")
         return
 
-    # Parse datetime with mixed formats
-    df['DateTime'] = df['Time'].apply(parse_mixed_datetime)
+    # A no-op when read_csv parsed every time; otherwise unparseable times become NaT
+    df['DateTime'] = pd.to_datetime(df['Time'], format='ISO8601', errors='coerce', cache=True)
     df = df.sort_values('DateTime').reset_index(drop=True)
 
     print(f"✅ Loaded {len(df)} transactions")
     print(f"📅 Date range: {df['DateTime'].min()} to {df['DateTime'].max()}")
 
-    for csv_line, row in df.iterrows():
-        print(f"→ CSV line {csv_line + 2}: "
-          f"{row['Time']} | {row['Action']} | {row.get('Ticker', '')}")
+    # One line per transaction, built column-wise and written at once; only
+    # useful when debugging a statement, so off unless PORTFOLIO_DEBUG is set
+    if os.environ.get('PORTFOLIO_DEBUG'):
+        csv_lines = pd.Series(df.index + 2, index=df.index).astype(str)
+        tickers = df['Ticker'] if 'Ticker' in df else pd.Series('', index=df.index)
+        lines = ("→ CSV line " + csv_lines + ": " + df['Time'].astype(str)
+                 + " | " + df['Action'].astype(str) + " | " + tickers.fillna('').astype(str))
+        sys.stdout.write('\n'.join(lines.tolist()) + '\n')
 
-    # Initialize portfolio tracking
-    cash = 0.0
-    positions = {}  # ticker -> {'shares': float, 'cost_eur': float, 'transactions': []}
+    # After the dump, which shows every action as written in the statement
+    df['Action'] = df['Action'].astype(ACTION_DTYPE)
 
     print("\n🔄 Processing transactions...")
 
-    for idx, row in df.iterrows():
-        action = row['Action']
-        amount = pd.to_numeric(row['Total'], errors='coerce') or 0
-
-        if action == 'Deposit':
-            cash += amount
-
-        elif action == 'Withdrawal':
-            cash += amount  # Amount is already negative for withdrawals
-
-        elif action == 'Interest on cash':
-            cash += amount
-
-        elif action in ['Market buy', 'Limit buy']:
-            ticker = row['Ticker']
-            shares = pd.to_numeric(row['Quantity'], errors='coerce') or 0
-            cost_eur = abs(amount)  # Total is negative for buys
-            conv_fee = pd.to_numeric(row['Currency conversion fee'], errors='coerce') or 0
-            total_cost = cost_eur + conv_fee
-
-            cash -= total_cost
-
-            if ticker not in positions:
-                positions[ticker] = {'shares': 0, 'cost_eur': 0, 'transactions': []}
-
-            positions[ticker]['shares'] += shares
-            positions[ticker]['cost_eur'] += total_cost
-            positions[ticker]['transactions'].append({
-                'date': row['DateTime'],
-                'action': 'buy',
-                'shares': shares,
-                'cost': total_cost
-            })
-
-        elif action in ['Market sell', 'Limit sell']:
-            ticker = row['Ticker']
-            shares = pd.to_numeric(row['Quantity'], errors='coerce') or 0
-            proceeds_eur = abs(amount)
-            conv_fee = pd.to_numeric(row['Currency conversion fee'], errors='coerce') or 0
-            net_proceeds = proceeds_eur - conv_fee
-
-            cash += net_proceeds
-
-            if ticker in positions:
-                # Reduce shares
-                positions[ticker]['shares'] -= shares
-
-                # Reduce cost basis proportionally
-                if positions[ticker]['shares'] > 0:
-                    cost_reduction_ratio = shares / (positions[ticker]['shares'] + shares)
-                    positions[ticker]['cost_eur'] *= (1 - cost_reduction_ratio)
-                else:
-                    positions[ticker]['cost_eur'] = 0
-
-                positions[ticker]['transactions'].append({
-                    'date': row['DateTime'],
-                    'action': 'sell',
-                    'shares': shares,
-                    'proceeds': net_proceeds
-                })
-
-    # Remove positions with zero or negative shares
-    positions = {k: v for k, v in positions.items() if v['shares'] > 0.001}
+    # Empty amounts count as zero
+    amount = df['Total'].fillna(0)
+    quantity = df['Quantity'].fillna(0)
+    conv_fee = df['Currency conversion fee'].fillna(0)
+
+    action_codes = df['Action'].cat.codes
+    is_cash = action_codes.isin(CASH_CODES)
+    is_buy = action_codes.isin(BUY_CODES)
+    is_sell = action_codes.isin(SELL_CODES)
+
+    # Totals are already signed for cash movements; buys cost the total plus the
+    # conversion fee and sells return the total less the fee
+    buy_cost = amount.abs() + conv_fee
+    cash = (amount[is_cash].sum()
+            - buy_cost[is_buy].sum()
+            + (amount.abs() - conv_fee)[is_sell].sum())
+
+    trades = pd.DataFrame({
+        'Ticker': df['Ticker'],
+        'is_buy': is_buy,
+        'signed_shares': quantity.where(is_buy, -quantity),
+        'buy_cost': buy_cost.where(is_buy, 0.0),
+    })[(is_buy | is_sell) & df['Ticker'].notna()]
+
+    # Sells only count against a position once it has been bought
+    trades = trades[trades.groupby('Ticker')['is_buy'].cummax()]
+
+    shares = trades.groupby('Ticker', sort=False)['signed_shares'].cumsum()
+
+    # A sell keeps shares_after / shares_before of the cost basis, and closing a
+    # position resets it. Each reset starts a new segment, within which
+    # cost_k = growth_k * sum(buy_cost_j / growth_j) for the running product growth.
+    sells = ~trades['is_buy']
+    kept = pd.Series(1.0, index=trades.index)
+    kept[sells] = (shares[sells] / (shares[sells] - trades['signed_shares'][sells])).where(shares[sells] > 0, 0.0)
+    segment = (kept == 0).groupby(trades['Ticker']).cumsum()
+    segments = [trades['Ticker'], segment]
+    growth = kept.replace(0.0, 1.0).groupby(segments).cumprod()
+    cost_eur = growth * (trades['buy_cost'] / growth).groupby(segments).cumsum()
+
+    # Keep only positions that are still open
+    positions = pd.DataFrame({'Ticker': trades['Ticker'], 'shares': shares, 'cost_eur': cost_eur})
+    positions = positions.groupby('Ticker', sort=False)[['shares', 'cost_eur']].last()
+    positions = positions[positions['shares'] > 0.001]
 
     print(f"💰 Final cash position: €{cash:.2f}")
     print(f"📊 Active positions: {len(positions)}")
 
-    if not positions:
+    if positions.empty:
         print("❌ No active positions found")
         return
 
-    print(f"🎯 Tickers: {', '.join(positions.keys())}")
+    print(f"🎯 Tickers: {', '.join(positions.index)}")
 
     # Get current prices and calculate portfolio metrics
     print("\n🔄 Fetching current market prices...")
 
-    portfolio_data = []
-    total_invested = 0
-    total_market_value = 0
-
-    for ticker, position in positions.items():
-        shares = position['shares']
-        cost_eur = position['cost_eur']
-        avg_cost = cost_eur / shares if shares > 0 else 0
-
-        print(f"📈 Getting price for {ticker}...")
-        current_price_native, currency = get_correct_ticker_and_price(ticker)
-
-        # Convert to EUR if needed
-        if currency != 'EUR':
-            fx_rate = get_fx_rate(currency, 'EUR')
-            current_price_eur = current_price_native * fx_rate
-        else:
-            current_price_eur = current_price_native
-
-        market_value = current_price_eur * shares
-        pnl_eur = market_value - cost_eur
-        pnl_percent = (pnl_eur / cost_eur * 100) if cost_eur > 0 else 0
-
-        portfolio_data.append({
-            'Ticker': ticker,
-            'Shares': shares,
-            'Avg Euro': avg_cost,
-            'Cost Euro': cost_eur,
-            'Price Euro': current_price_eur,
-            'Value Euro': market_value,
-            'P&L Euro': pnl_eur,
-            'P&L %': pnl_percent
-        })
-
-        total_invested += cost_eur
-        total_market_value += market_value
+    print(f"📈 Getting prices for {len(positions)} tickers...")
+
+    # FX rates for the currencies the statement quotes are fetched in the same
+    # download as the prices; one rate per currency, however many positions use it
+    statement_currencies = set()
+    if 'Currency (Price / share)' in df:
+        statement_currencies = set(
+            df.loc[df['Ticker'].isin(positions.index), 'Currency (Price / share)'].dropna()
+        ) - {'EUR'}
+    prices, fx_rates = get_prices(list(positions.index), statement_currencies)
+
+    # Yahoo may quote a ticker in a currency the statement doesn't use
+    missing = {currency for _, currency in prices.values() if currency != 'EUR'} - set(fx_rates)
+    if missing:
+        fx_rates.update(get_fx_rates(missing))
+
+    # Per-position metrics, computed column-wise
+    pf = pd.DataFrame({
+        'Ticker': positions.index,
+        'Shares': positions['shares'].to_numpy(),
+        'Cost_EUR': positions['cost_eur'].to_numpy(),
+        'Price_native': [float(prices[ticker][0]) for ticker in positions.index],
+        'Currency': [prices[ticker][1] for ticker in positions.index],
+    })
+    pf['Avg_EUR'] = pf['Cost_EUR'] / pf['Shares']
+    pf['Price_EUR'] = pf['Price_native'] * pf['Currency'].map(fx_rates).fillna(1.0)
+    pf['Value_EUR'] = pf['Price_EUR'] * pf['Shares']
+    pf['PnL_EUR'] = pf['Value_EUR'] - pf['Cost_EUR']
+    pf['PnL_pct'] = (pf['PnL_EUR'] / pf['Cost_EUR'] * 100).where(pf['Cost_EUR'] > 0, 0.0)
 
     # Calculate totals
+    total_invested = pf['Cost_EUR'].sum()
+    total_market_value = pf['Value_EUR'].sum()
     total_account_value = cash + total_market_value
     unrealized_pnl = total_market_value - total_invested
     unrealized_pnl_percent = (unrealized_pnl / total_invested * 100) if total_invested > 0 else 0
 
     # Sort by value (largest positions first)
-    sorted_portfolio = sorted(portfolio_data, key=lambda x: x['Value Euro'], reverse=True)
-
-    # Generate report
-    print("\n" + "="*80)
-    print("🏦 TRADING 212 PORTFOLIO SUMMARY")
-    print("="*80)
-
-    # Account Summary
-    print("\n📊 ACCOUNT SUMMARY")
-    print("-" * 40)
-    print(f"Free cash        : €{cash:>12,.2f}")
-    print(f"Invested amount  : €{total_invested:>12,.2f}")
-    print(f"Portfolio value  : €{total_market_value:>12,.2f}")
-    print("-" * 40)
-    print(f"TOTAL ACCOUNT    : €{total_account_value:>12,.2f}")
-    print(f"Unrealised P&L   : €{unrealized_pnl:>12,.2f}  ({unrealized_pnl_percent:>6.2f}%)")
-
-    # Ticker Summary Table
-    print(f"\n📈 TICKER SUMMARY")
-    print("-" * 80)
-    print(f"{'Ticker':<8} {'Shares':<9} {'Avg €':<8} {'Cost €':<10} {'Price €':<9} {'Value €':<11} {'P&L €':<10} {'P&L %':<8}")
-    print("-" * 80)
-
-    for position in sorted_portfolio:
-        print(f"{position['Ticker']:<8} "
-              f"{position['Shares']:>8.3f} "
-              f"{position['Avg Euro']:>8.2f} "
-              f"{position['Cost Euro']:>10.2f} "
-              f"{position['Price Euro']:>9.2f} "
-              f"{position['Value Euro']:>11.2f} "
-              f"{position['P&L Euro']:>10.2f} "
-              f"{position['P&L %']:>7.2f}%")
-
-    print("-" * 80)
-    print(f"{'TOTAL':<8} {'':<9} {'':<8} {total_invested:>10.2f} {'':<9} {total_market_value:>11.2f} {unrealized_pnl:>10.2f} {unrealized_pnl_percent:>7.2f}%")
+    pf = pf.sort_values('Value_EUR', ascending=False, kind='stable')
 
-    # Additional metrics
-    print(f"\n📋 ADDITIONAL METRICS")
-    print("-" * 40)
-    largest_position = max(sorted_portfolio, key=lambda x: x['Value Euro'])
-    best_performer = max(sorted_portfolio, key=lambda x: x['P&L %'])
-    worst_performer = min(sorted_portfolio, key=lambda x: x['P&L %'])
-
-    print(f"Largest position  : {largest_position['Ticker']} (€{largest_position['Value Euro']:,.2f})")
-    print(f"Best performer    : {best_performer['Ticker']} ({best_performer['P&L %']:+.2f}%)")
-    print(f"Worst performer   : {worst_performer['Ticker']} ({worst_performer['P&L %']:+.2f}%)")
-    print(f"Portfolio size    : {len(positions)} positions")
-    print(f"Cash allocation   : {(cash/total_account_value)*100:.1f}% of total account")
-
-    print(f"\n🕐 Report generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    print("="*80)
-
-    # Create the report content for file
-    report_content = f"""================================================================================
+    # Render the report once; the same text goes to stdout and to the file
+    report = io.StringIO()
+    report.write(f"""================================================================================
 🏦 TRADING 212 PORTFOLIO SUMMARY
 ================================================================================
 
@@ -318,38 +440,39 @@ Unrealised P&L   : €{unrealized_pnl:>12,.2f}  ({unrealized_pnl_percent:>6.2f}%
 --------------------------------------------------------------------------------
 {'Ticker':<8} {'Shares':<9} {'Avg €':<8} {'Cost €':<10} {'Price €':<9} {'Value €':<11} {'P&L €':<10} {'P&L %':<8}
 --------------------------------------------------------------------------------
-"""
+""")
 
     # Add each position
-    for position in sorted_portfolio:
-        report_content += f"""{position['Ticker']:<8} {position['Shares']:>8.3f} {position['Avg Euro']:>8.2f} {position['Cost Euro']:>10.2f} {position['Price Euro']:>9.2f} {position['Value Euro']:>11.2f} {position['P&L Euro']:>10.2f} {position['P&L %']:>7.2f}%
-"""
+    report.write("\n".join(ROW.format_map(position) for position in pf.to_dict('records')) + "\n")
+
+    # Additional metrics
+    largest_position = pf.loc[pf['Value_EUR'].idxmax()]
+    best_performer = pf.loc[pf['PnL_pct'].idxmax()]
+    worst_performer = pf.loc[pf['PnL_pct'].idxmin()]
 
-    report_content += f"""--------------------------------------------------------------------------------
+    report.write(f"""--------------------------------------------------------------------------------
 {'TOTAL':<8} {'':<9} {'':<8} {total_invested:>10.2f} {'':<9} {total_market_value:>11.2f} {unrealized_pnl:>10.2f} {unrealized_pnl_percent:>7.2f}%
 
 📋 ADDITIONAL METRICS
 ----------------------------------------
-Largest position  : {largest_position['Ticker']} (€{largest_position['Value Euro']:,.2f})
-Best performer    : {best_performer['Ticker']} ({best_performer['P&L %']:+.2f}%)
-Worst performer   : {worst_performer['Ticker']} ({worst_performer['P&L %']:+.2f}%)
+Largest position  : {largest_position['Ticker']} (€{largest_position['Value_EUR']:,.2f})
+Best performer    : {best_performer['Ticker']} ({best_performer['PnL_pct']:+.2f}%)
+Worst performer   : {worst_performer['Ticker']} ({worst_performer['PnL_pct']:+.2f}%)
 Portfolio size    : {len(positions)} positions
 Cash allocation   : {(cash/total_account_value)*100:.1f}% of total account
 
 🕐 Report generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
 Data source: Trading 212 combined statement
 ================================================================================
-"""
-
-    # Create exports directory if it doesn't exist
-    if not os.path.exists('exports'):
-        os.makedirs('exports')
+""")
+    report_content = report.getvalue()
+    sys.stdout.write("\n" + report_content)
 
-    # Save the report
-    with open('exports/portfolio_summary.txt', 'w', encoding='utf-8') as f:
-        f.write(report_content)
+    # Save the report, creating exports/ if needed
+    SUMMARY_FILE.parent.mkdir(parents=True, exist_ok=True)
+    SUMMARY_FILE.write_text(report_content, encoding='utf-8')
 
-    print("\n💾 Portfolio summary saved to: exports/portfolio_summary.txt")
+    print(f"\n💾 Portfolio summary saved to: {SUMMARY_FILE}")
     print("\n✅ Analysis complete! Your portfolio shows:")
     print(f"   • Total account value: €{total_account_value:,.2f}")
     print(f"   • Unrealized P&L: €{unrealized_pnl:,.2f} ({unrealized_pnl_percent:+.2f}%)")
@@ -6,11 +6,16 @@ Automates the execution of portfolio analysis workflow with proper encoding hand
 """
 
 
+import contextlib
+import importlib
+import io
 import subprocess
 import logging
+import logging.handlers
 import sys
 import time
 import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
 
@@ -33,6 +38,19 @@ class WorkflowAutomator:
             "perplexity_analyzer.py": "AI analysis via Perplexity API",
             "portfolio_notifier.py": "Telegram notification delivery"
         }
+        # Scripts whose output each script reads; scripts with no unfinished
+        # dependencies between them run concurrently (see plan_waves)
+        self.dependencies = {
+            "portfolio_analyzer.py": [],
+            "perplexity_analyzer.py": ["portfolio_analyzer.py"],  # exports/portfolio_summary.txt
+            "portfolio_notifier.py": ["perplexity_analyzer.py"]   # latest portfolio analysis
+        }
+        # Module, function and arguments that run each script in this process
+        self.entry_points = {
+            "portfolio_analyzer.py": ("portfolio_analyzer", "analyze_portfolio", ()),
+            "perplexity_analyzer.py": ("perplexity_analyzer", "main", ([],)),
+            "portfolio_notifier.py": ("portfolio_notifier", "main", ())
+        }
         
         # Set environment for UTF-8 encoding
         os.environ['PYTHONIOENCODING'] = 'utf-8'
@@ -51,13 +69,21 @@ class WorkflowAutomator:
         # Configure logging format
         log_format = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
 
+        # Console records are buffered and written once per step (see
+        # run_workflow); errors are written straight away
+        console = logging.StreamHandler(sys.stdout)
+        console.setFormatter(logging.Formatter(log_format))
+        self.console = logging.handlers.MemoryHandler(
+            capacity=100, flushLevel=logging.ERROR, target=console
+        )
+
         # Configure root logger
         logging.basicConfig(
             level=log_level,
             format=log_format,
             handlers=[
-                logging.FileHandler(log_file, encoding='utf-8'),
-                logging.StreamHandler(sys.stdout)
+                logging.FileHandler(log_file, encoding='utf-8', delay=True),
+                self.console
             ]
         )
 
@@ -131,69 +157,127 @@ class WorkflowAutomator:
             self.logger.error(f"Unexpected error running {script_name}: {str(e)}")
             return False
 
-    def wait_for_completion(self, script_name, max_wait_time=10):
-        """Wait for script to complete file operations."""
-        self.logger.info(f"Waiting for {script_name} to complete file operations...")
-        time.sleep(max_wait_time)
-        self.logger.info("Wait period completed")
+    def run_step(self, script_name):
+        """
+        Run a workflow step in this process, so the interpreter and shared imports
+        are only loaded once. Falls back to run_script() if the module can't be imported.
+        """
+        if not self.validate_script_exists(script_name):
+            return False
+
+        module_name, function_name, args = self.entry_points[script_name]
+        try:
+            entry_point = getattr(importlib.import_module(module_name), function_name)
+        except (ImportError, AttributeError) as e:
+            self.logger.warning(f"Cannot import {module_name}.{function_name} ({e}), running {script_name} as a subprocess")
+            return self.run_script(script_name)
+
+        description = self.script_descriptions.get(script_name, script_name)
+        self.logger.info(f"Starting execution: {description}")
+        self.logger.info(f"Calling {module_name}.{function_name}() in-process")
+
+        # Capture what the step prints, as the subprocess runner does
+        output = io.StringIO()
+        try:
+            with contextlib.redirect_stdout(output):
+                entry_point(*args)
+            success = True
+        except SystemExit as e:
+            success = e.code in (None, 0)
+            if not success:
+                self.logger.error(f"❌ {script_name} exited with code: {e.code}")
+        except Exception as e:
+            self.logger.error(f"❌ {script_name} failed: {type(e).__name__}: {str(e)}")
+            success = False
+
+        stdout = output.getvalue().strip()
+        if success:
+            self.logger.info(f"✅ {script_name} completed successfully")
+            if stdout:
+                self.logger.info(f"Output: {stdout}")
+        elif stdout:
+            self.logger.info(f"Standard output: {stdout}")
+        return success
+
+    def plan_waves(self):
+        """Group the scripts into waves that only depend on scripts in earlier waves."""
+        waves = []
+        done = set()
+        pending = list(self.scripts)
+        while pending:
+            wave = [script for script in pending if set(self.dependencies.get(script, [])) <= done]
+            if not wave:
+                raise ValueError(f"Circular dependencies between: {', '.join(pending)}")
+            waves.append(wave)
+            done.update(wave)
+            pending = [script for script in pending if script not in wave]
+        return waves
+
+    def run_wave(self, wave):
+        """Run one wave of independent scripts and return {script: success}."""
+        if len(wave) == 1:
+            return {wave[0]: self.run_step(wave[0])}
+
+        # In-process steps would share sys.stdout, so independent scripts run as subprocesses
+        self.logger.info(f"Running {len(wave)} independent steps concurrently")
+        with ThreadPoolExecutor(max_workers=len(wave)) as pool:
+            return dict(zip(wave, pool.map(self.run_script, wave)))
 
     def run_workflow(self, continue_on_failure=False):
-        """Execute the complete workflow in sequence."""
-        self.logger.info("=" * 60)
-        self.logger.info("STARTING PORTFOLIO AUTOMATION WORKFLOW")
-        self.logger.info("=" * 60)
+        """Execute the complete workflow, one wave of independent scripts at a time."""
+        self.logger.info("\n".join(["=" * 60, "STARTING PORTFOLIO AUTOMATION WORKFLOW", "=" * 60]))
 
         workflow_start_time = time.time()
         results = {}
 
-        for i, script in enumerate(self.scripts, 1):
+        step = 0
+        for wave in self.plan_waves():
             step_start_time = time.time()
+            first_step = step + 1
 
-            self.logger.info(f"\\n📋 STEP {i}/{len(self.scripts)}: {script}")
-            self.logger.info("-" * 40)
+            lines = []
+            for script in wave:
+                step += 1
+                lines.append(f"📋 STEP {step}/{len(self.scripts)}: {script}")
+                lines.append("-" * 40)
+            self.logger.info("\n".join(lines))
 
-            # Execute the script
-            success = self.run_script(script)
-            results[script] = success
+            # Execute the scripts
+            wave_results = self.run_wave(wave)
+            results.update(wave_results)
 
             step_duration = time.time() - step_start_time
-            self.logger.info(f"Step {i} duration: {step_duration:.2f} seconds")
+            steps = f"Step {step}" if step == first_step else f"Steps {first_step}-{step}"
+            self.logger.info(f"{steps} duration: {step_duration:.2f} seconds")
+            self.console.flush()
 
-            if success:
-                # Wait for script to complete file operations
-                self.wait_for_completion(script, max_wait_time=5)
-            else:
+            # Every script in the wave has finished writing its files by now
+            failed = [script for script, success in wave_results.items() if not success]
+            if failed:
                 if continue_on_failure:
-                    self.logger.warning(f"Continuing workflow despite {script} failure")
+                    self.logger.warning(f"Continuing workflow despite {', '.join(failed)} failure")
                 else:
-                    self.logger.error(f"Stopping workflow due to {script} failure")
+                    self.logger.error(f"Stopping workflow due to {', '.join(failed)} failure")
                     break
 
-            # Brief pause between scripts
-            if i < len(self.scripts):
-                self.logger.info("Pausing before next step...")
-                time.sleep(2)
-
         # Workflow summary
         total_duration = time.time() - workflow_start_time
-        self.logger.info("\\n" + "=" * 60)
-        self.logger.info("WORKFLOW SUMMARY")
-        self.logger.info("=" * 60)
-
         successful_scripts = sum(results.values())
         total_scripts = len(self.scripts)
 
+        lines = ["=" * 60, "WORKFLOW SUMMARY", "=" * 60]
         for script, success in results.items():
             status = "✅ SUCCESS" if success else "❌ FAILED"
-            self.logger.info(f"{script}: {status}")
-
-        self.logger.info(f"\\nTotal execution time: {total_duration:.2f} seconds")
-        self.logger.info(f"Success rate: {successful_scripts}/{total_scripts} scripts")
+            lines.append(f"{script}: {status}")
+        lines.append(f"Total execution time: {total_duration:.2f} seconds")
+        lines.append(f"Success rate: {successful_scripts}/{total_scripts} scripts")
+        self.logger.info("\n".join(lines))
 
         if successful_scripts == total_scripts:
             self.logger.info("🎉 WORKFLOW COMPLETED SUCCESSFULLY!")
         else:
             self.logger.warning(f"⚠️ WORKFLOW COMPLETED WITH {total_scripts - successful_scripts} FAILURES")
+        self.console.flush()
 
         return results
 
@@ -1,5 +1,5 @@
 import requests
-import json
+from requests.adapters import HTTPAdapter
 import re
 from datetime import datetime
 import os
@@ -9,6 +9,8 @@ from bs4 import BeautifulSoup
 from dotenv import load_dotenv
 load_dotenv()  # Load variables from .env file
 MAX_LENGTH = 4096  # Telegram max character limit
+_THINK_RE = re.compile(r"<think>.*?</think>", re.DOTALL)  # model reasoning blocks
+REQUEST_TIMEOUT = 10  # seconds per Telegram API call
 
 class TelegramNotifier:
     def __init__(self, bot_token, chat_id):
@@ -16,6 +18,10 @@ class TelegramNotifier:
         self.chat_id = chat_id
         self.base_url = f"https://api.telegram.org/bot{bot_token}"
 
+        # One pooled session, so consecutive messages reuse the TLS connection
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=4))
+
     def send_message(self, message, parse_mode=None):
         """
         Send a message to the specified chat
@@ -38,7 +44,7 @@ class TelegramNotifier:
             data['parse_mode'] = parse_mode
 
         try:
-            response = requests.post(url, data=data)
+            response = self.session.post(url, data=data, timeout=REQUEST_TIMEOUT)
             return response.json()
         except Exception as e:
             print(f"❌ Error sending message: {e}")
@@ -57,7 +63,7 @@ class TelegramNotifier:
         """
         url = f"{self.base_url}/getMe"
         try:
-            response = requests.get(url)
+            response = self.session.get(url, timeout=REQUEST_TIMEOUT)
             result = response.json()
             if result.get('ok'):
                 bot_info = result.get('result', {})
@@ -98,7 +104,7 @@ def load_portfolio_summary():
             return None
 
         # Remove the <think> block
-        cleaned_content = re.sub(r"<think>.*?</think>", "", content, flags=re.DOTALL)
+        cleaned_content = _THINK_RE.sub("", content)
 
         return cleaned_content
     except Exception as e: